@@ -3,18 +3,42 @@ import discord
 from discord.ext import commands, tasks
 
 import os
+import re
 import logging
 import asyncio
+import concurrent.futures
 import time
+import threading
 import traceback
 from typing import Dict, Any, AsyncGenerator, Optional, List, Generator
-from collections import deque
 
 from meta_ai_api import MetaAI
 from dotenv import load_dotenv
 
 
-from custom_prompt import create_gama_instance, curses
+from custom_prompt import create_gama_instance, CURSE_SET
+
+
+_STREAM_END = object()
+_WORD_RE = re.compile(r"[A-Za-z]+")
+_DASHES = "-" * 128 # longer than any listed curse
+_SORRY_RE = re.compile(r"sorry,?\s+i\s+can(?:'|\u2019|\u2018)?t\s+help", re.IGNORECASE)
+
+
+def _censor_word(match: re.Match) -> str:
+	"""Dashes out a matched word if it is on the curse list."""
+	word = match.group()
+	if len(word) > 2 and word.lower() in CURSE_SET:
+		return word[:2] + _DASHES[:len(word) - 2]
+	return word
+
+
+def _log_future_error(description: str):
+	"""Builds a done-callback that logs a failed background future."""
+	def _callback(future: asyncio.Future):
+		if not future.cancelled() and future.exception() is not None:
+			logging.error(f"{description}: {future.exception()!r}")
+	return _callback
 
 
 def setup_logging():
@@ -39,26 +63,22 @@ class BotConfig:
 	"""Stores bot constants."""
 	DISCORD_MSG_CHAR_LIMIT = 1000
 	UPDATE_INTERVAL_SECONDS = 0.7
+	MAX_UPDATE_INTERVAL_SECONDS = 2.0
 	AI_INACTIVITY_THRESHOLD = 15 * 60
 	AI_MAX_ERRORS = 3
-	AI_SORRY_PHRASE = "Sorry, I can’t help you" 
+	DEFAULT_AI_MAX_CONCURRENT_STREAMS = 1 # one MetaAI conversation, one prompt at a time
 	AI_MAX_SORRY_RESPONSES = 3 
 	REQUEST_LIMIT_PER_MINUTE = 8
-	RATE_LIMIT_COOLDOWN_SECONDS = 15
 	RATE_LIMIT_MESSAGE = "hey hey, are you trolling me? Give me a second to chill out and try again."
+	MAX_ACTIVE_RESPONSES = 10
+	BUSY_MESSAGE = "I'm juggling too many convos right now, try again in a bit."
+	STREAM_QUEUE_SIZE = 32
+	DEFAULT_THREAD_POOL_SIZE = 64
 
 
 class CustomPrompts:
 	"""Module for custom AI prompts."""
-	@staticmethod
-	def get_restart_prompt() -> str:
-		"""Gets system-check prompt."""
-		return "Confirm you are operational by responding with 'System OK'."
-
-	@staticmethod
-	def format_user_prompt(prompt: str) -> str:
-		"""Formats user prompt."""
-		return f"""Reminder: You are roleplaying as the Discord user from the ingested logs. You must ONLY speak as they would. Pull directly from their past messages or synthesize new replies by subtly remixing and rephrasing real content from the logs.
+	_PROMPT_PREFIX = """Reminder: You are roleplaying as the Discord user from the ingested logs. You must ONLY speak as they would. Pull directly from their past messages or synthesize new replies by subtly remixing and rephrasing real content from the logs.
 
 						Maintain:
 						- Their tone, style, attitude, spelling, slang, and punctuation.
@@ -69,29 +89,70 @@ class CustomPrompts:
 
 						Now respond to the user who mentioned you as they would:
 						[START DISCORD USER PROMPT]
-						{prompt}
+						"""
+	_PROMPT_SUFFIX = """
 						[END DISCORD USER PROMPT]
 						"""
 
+	@staticmethod
+	def get_restart_prompt() -> str:
+		"""Gets system-check prompt."""
+		return "Confirm you are operational by responding with 'System OK'."
+
+	@classmethod
+	def format_user_prompt(cls, prompt: str) -> str:
+		"""Formats user prompt."""
+		return cls._PROMPT_PREFIX + prompt + cls._PROMPT_SUFFIX
+
 
 class MetaAIManager:
 	"""Manages MetaAI session."""
-	def __init__(self, inactivity_threshold: int, max_errors: int):
+	def __init__(self, inactivity_threshold: int, max_errors: int, max_concurrent_streams: int):
 		self.ai_instance: Optional[MetaAI] = None
-		self.lock = asyncio.Lock()
+		self.lock = asyncio.Lock() # guards session start/restart
+		self.stream_slots = asyncio.BoundedSemaphore(max_concurrent_streams)
+		self.active_streams = 0
+		self._instance_streams: Dict[int, int] = {} # id(instance) -> streams still using it
 		self.error_count = 0
 		self.sorry_response_count = 0 
 		self.max_errors = max_errors
-		self.last_activity_time: float = time.time()
+		self.last_activity_time: float = time.monotonic()
 		self.inactivity_threshold = inactivity_threshold
 
+	@staticmethod
+	def _close_instance(instance: MetaAI):
+		"""Releases an instance's connections. Blocking."""
+		close = getattr(instance, "close", None) or getattr(getattr(instance, "session", None), "close", None)
+		if close:
+			close()
+
+	def _release_instance(self, instance: MetaAI):
+		"""Ends a stream's use of an instance, closing it if it was retired."""
+		key = id(instance)
+		self._instance_streams[key] -= 1
+		if self._instance_streams[key]:
+			return
+		del self._instance_streams[key]
+		if instance is not self.ai_instance:
+			logging.info("Last stream on retired Meta AI session finished. Closing it.")
+			future = asyncio.get_running_loop().run_in_executor(None, self._close_instance, instance)
+			future.add_done_callback(_log_future_error("Failed to close old Meta AI session"))
+
 	async def start_session(self) -> bool:
 		"""Initializes MetaAI session."""
 		logging.info("Initializing Meta AI session...")
 		async with self.lock:
-			if self.ai_instance:
-				del self.ai_instance
+			if self.ai_instance is not None:
+				old_instance = self.ai_instance
 				self.ai_instance = None
+				if id(old_instance) in self._instance_streams:
+					# the last stream still using it closes it
+					logging.info("Old Meta AI session has streams in flight. Deferring close.")
+				else:
+					try:
+						await asyncio.to_thread(self._close_instance, old_instance)
+					except Exception as e:
+						logging.warning(f"Failed to close old Meta AI session: {e}")
 
 			try:
 				if os.getenv("DOCKER_ENV"):
@@ -115,7 +176,7 @@ class MetaAIManager:
 				logging.info("Meta AI session started successfully.")
 				self.error_count = 0
 				self.sorry_response_count = 0 
-				self.last_activity_time = time.time()
+				self.last_activity_time = time.monotonic()
 				return True
 			except Exception as e:
 				logging.error(f"Failed to start Meta AI session: {e}")
@@ -132,33 +193,49 @@ class MetaAIManager:
 		self, prompt: str
 	) -> AsyncGenerator[Dict[str, Any], None]:
 		"""Gets streamed response from AI."""
-		self.last_activity_time = time.time()
+		self.last_activity_time = time.monotonic()
 		if not self.ai_instance:
 			logging.error("AI not initialized. Restarting...")
 			if not await self.restart_session():
 				yield {"error": "AI session could not be restarted."}
 				return
 
-		def _get_next_chunk(generator: Generator) -> Any:
+		def _drain(
+			ai_instance: MetaAI, queue: asyncio.Queue,
+			loop: asyncio.AbstractEventLoop, stop: threading.Event
+		) -> None:
+			"""Consumes the sync stream in one worker thread and feeds the queue."""
 			try:
-				return next(generator)
-			except StopIteration:
-				return None
+				for chunk in ai_instance.prompt(message=prompt, stream=True):
+					if stop.is_set():
+						break
+					asyncio.run_coroutine_threadsafe(queue.put(chunk), loop).result()
+			except Exception as e:
+				asyncio.run_coroutine_threadsafe(queue.put(e), loop).result()
+			finally:
+				asyncio.run_coroutine_threadsafe(queue.put(_STREAM_END), loop).result()
+
+		async with self.stream_slots:
+			async with self.lock:
+				# waits out a restart in progress
+				ai_instance = self.ai_instance
+			if not ai_instance:
+				yield {"error": "AI session is not available."}
+				return
 
-		async with self.lock:
+			self.active_streams += 1
+			self._instance_streams[id(ai_instance)] = self._instance_streams.get(id(ai_instance), 0) + 1
 			logging.info(f"New prompt: '{prompt[:75]}...'")
+			queue: asyncio.Queue[Any] = asyncio.Queue(maxsize=BotConfig.STREAM_QUEUE_SIZE)
+			stop = threading.Event()
 			try:
-				response_generator = self.ai_instance.prompt(
-					message=prompt, stream=True
-				)
 				loop = asyncio.get_running_loop()
+				drain_future = loop.run_in_executor(None, _drain, ai_instance, queue, loop, stop)
+				drain_future.add_done_callback(_log_future_error("Meta AI stream worker failed"))
 
-				while True:
-					chunk = await loop.run_in_executor(
-						None, _get_next_chunk, response_generator
-					)
-					if chunk is None:
-						break
+				while (chunk := await queue.get()) is not _STREAM_END:
+					if isinstance(chunk, Exception):
+						raise chunk
 					yield chunk
 
 				self.error_count = 0
@@ -170,13 +247,20 @@ class MetaAIManager:
 				if self.error_count >= self.max_errors:
 					logging.warning("Max errors reached. Auto-restarting.")
 					await self.restart_session()
+			finally:
+				self.active_streams -= 1
+				# unblock the worker if the consumer stopped early
+				stop.set()
+				while not queue.empty():
+					queue.get_nowait()
+				self._release_instance(ai_instance)
 
 	@tasks.loop(minutes=1.0)
 	async def check_inactivity(self):
 		"""Checks for inactivity."""
 		try:
-			is_inactive = (time.time() - self.last_activity_time) > self.inactivity_threshold
-			is_free = not self.lock.locked()
+			is_inactive = (time.monotonic() - self.last_activity_time) > self.inactivity_threshold
+			is_free = not self.lock.locked() and self.active_streams == 0
 
 			if is_inactive and is_free:
 				logging.info(f"Inactive > {self.inactivity_threshold / 60:.0f}m. Restarting.")
@@ -198,6 +282,11 @@ class DiscordMessageHandler:
 		self.message = message
 		self.prompt = prompt
 		self.bot_message: Optional[discord.Message] = None
+		self._pending_edit_task: Optional[asyncio.Task] = None
+		self._pending_content: str = ""
+		self._pending_len = 0
+		self._last_sent_display: str = ""
+		self._last_chunk_time: float = 0.0
 
 	def _truncate(self, content: str) -> str:
 		"""Truncates long messages."""
@@ -205,6 +294,11 @@ class DiscordMessageHandler:
 			return content[:BotConfig.DISCORD_MSG_CHAR_LIMIT - 4] + "..."
 		return content
 
+	def _prepare_prompt(self) -> str:
+		"""Censors and formats the user prompt. Run off the event loop."""
+		censored = _WORD_RE.sub(_censor_word, self.prompt)
+		return CustomPrompts.format_user_prompt(censored)
+
 	def _format_sources(self, sources: Optional[List[Dict[str, str]]]) -> str:
 		"""Formats sources for display."""
 		if not sources:
@@ -218,18 +312,47 @@ class DiscordMessageHandler:
 		logging.error(err_msg)
 		await self.bot_message.edit(content=self._truncate(err_msg))
 
-	async def _update_streamed_message(self, chunk: Dict[str, Any], last_edit_time: float, edited_content: str) -> tuple[float, str]:
-		"""Updates the Discord message with new stream content."""
+	def _update_streamed_message(self, chunk: Dict[str, Any]):
+		"""Queues new stream content for a debounced message edit."""
+		# chunks carry the full text so far, so growth means new content
 		content_buffer = chunk.get("message", "")
-		now = time.time()
-		
-		if (now - last_edit_time > BotConfig.UPDATE_INTERVAL_SECONDS and content_buffer != edited_content):
-			display_content = self._truncate(content_buffer) + "..."
-			await self.bot_message.edit(content=display_content)
-			return now, content_buffer
-		
-		return last_edit_time, edited_content
-	
+		if len(content_buffer) <= self._pending_len:
+			return
+
+		self._pending_content = content_buffer
+		self._pending_len = len(content_buffer)
+		self._last_chunk_time = time.monotonic()
+		if self._pending_edit_task is None or self._pending_edit_task.done():
+			self._pending_edit_task = asyncio.create_task(self._debounced_edit())
+
+	async def _debounced_edit(self):
+		"""Edits the message once the stream goes quiet, or after the max interval."""
+		deadline = time.monotonic() + BotConfig.MAX_UPDATE_INTERVAL_SECONDS
+		while True:
+			quiet_at = self._last_chunk_time + BotConfig.UPDATE_INTERVAL_SECONDS
+			wait = min(quiet_at, deadline) - time.monotonic()
+			if wait <= 0:
+				break
+			await asyncio.sleep(wait)
+
+		# past the char limit every chunk truncates to the same text
+		display = self._truncate(self._pending_content) + "..."
+		if display == self._last_sent_display:
+			return
+
+		try:
+			await self.bot_message.edit(content=display)
+			self._last_sent_display = display
+		except discord.errors.DiscordException as e:
+			logging.error(f"Failed to edit streamed message: {e}")
+
+	async def _cancel_pending_edit(self):
+		"""Drops any queued stream edit so it can't overwrite a final message."""
+		if self._pending_edit_task and not self._pending_edit_task.done():
+			self._pending_edit_task.cancel()
+			# swallows only the edit task's cancellation, not our own
+			await asyncio.gather(self._pending_edit_task, return_exceptions=True)
+
 	async def _handle_sorry_limit_restart(self):
 		"""Handles the auto-restart when the 'sorry' limit is reached."""
 		logging.warning(f"AI 'sorry' limit of {BotConfig.AI_MAX_SORRY_RESPONSES} reached. Triggering restart.")
@@ -240,7 +363,7 @@ class DiscordMessageHandler:
 		"""Edits the final message with the complete response and sources."""
 		final_message = last_chunk.get("message", "").strip()
 
-		if BotConfig.AI_SORRY_PHRASE in final_message:
+		if _SORRY_RE.search(final_message):
 			self.bot.ai_manager.sorry_response_count += 1
 			logging.warning(f"AI 'sorry' response detected. Count: {self.bot.ai_manager.sorry_response_count}")
 
@@ -261,69 +384,33 @@ class DiscordMessageHandler:
 
 	async def process_response(self):
 		"""Main handler for the AI response lifecycle."""
-		global curses
 		try:
-			for curse in curses:
-				if curses:
-					curse_set = {c.lower() for c in curses}
-					
-					new_prompt_parts = []
-					current_word = ""
-
-					
-					for char in self.prompt:
-						if char.isalpha():
-							current_word += char
-						else:
-							
-							if current_word:
-								
-								if current_word.lower() in curse_set and len(current_word) > 2:
-									censored = current_word[:2] + '-' * (len(current_word) - 2)
-									new_prompt_parts.append(censored)
-								else:
-									new_prompt_parts.append(current_word)
-								current_word = ""
-							new_prompt_parts.append(char)
-					
-					
-					if current_word:
-						if current_word.lower() in curse_set and len(current_word) > 2:
-							censored = current_word[:2] + '-' * (len(current_word) - 2)
-							new_prompt_parts.append(censored)
-						else:
-							new_prompt_parts.append(current_word)
-					
-					self.prompt = "".join(new_prompt_parts)
-
-			
- 
-			self.bot_message = await self.message.channel.send("😈 Thinking...", reference=self.message)
-			stream = self.bot.ai_manager.get_response_stream(
-				CustomPrompts.format_user_prompt(self.prompt)
+			self.bot_message, final_prompt = await asyncio.gather(
+				self.message.channel.send("😈 Thinking...", reference=self.message),
+				asyncio.to_thread(self._prepare_prompt)
 			)
+			stream = self.bot.ai_manager.get_response_stream(final_prompt)
 
-			last_edit_time = time.time()
-			edited_content = ""
 			last_chunk = {}
 
 			async with self.message.channel.typing():
 				async for chunk in stream:
 					if "error" in chunk:
+						await self._cancel_pending_edit()
 						await self._handle_stream_error(chunk)
 						return
 					
 					last_chunk = chunk
-					last_edit_time, edited_content = await self._update_streamed_message(
-						chunk, last_edit_time, edited_content
-					)
+					self._update_streamed_message(chunk)
 			
+			await self._cancel_pending_edit()
 			await self._finalize_message(last_chunk)
 
 		except Exception as e:
 			logging.error(f"Error in DiscordMessageHandler: {e}")
 			traceback.print_exception(type(e), e, e.__traceback__)
 			if self.bot_message:
+				await self._cancel_pending_edit()
 				try:
 					await self.bot_message.edit(content="A bot error occurred. Check logs.")
 				except discord.errors.DiscordException as de:
@@ -342,11 +429,21 @@ class MetaDiscordBot(commands.Bot):
 		intents.message_content = True
 		super().__init__(command_prefix="!", intents=intents)
 		self.ai_manager = ai_manager
-		self.request_timestamps: deque[float] = deque() # rate limit
-		self.cooldown_until: float = 0.0 # rate limit
+		self._tokens: float = BotConfig.REQUEST_LIMIT_PER_MINUTE # rate limit bucket
+		self._last_refill: float = time.monotonic() # rate limit bucket
+		self._cooldown_notified = False # rate limit notice already sent
+		self._mention_re: Optional[re.Pattern] = None # set once self.user is known
+		self._active_tasks: set[asyncio.Task] = set() # strong refs to in-flight responses
 
 	async def setup_hook(self) -> None:
 		"""Runs on bot setup."""
+		# bot.run() owns the event loop, so size its executor here
+		pool_size = int(os.getenv("THREAD_POOL_SIZE", BotConfig.DEFAULT_THREAD_POOL_SIZE))
+		asyncio.get_running_loop().set_default_executor(
+			concurrent.futures.ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="gamabot")
+		)
+		logging.info(f"Default executor sized to {pool_size} threads.")
+		self._mention_re = re.compile(rf"<@!?{self.user.id}>")
 		await self.ai_manager.start_session()
 		self.ai_manager.check_inactivity.start()
 		logging.info("Setup hook complete. Tasks started.")
@@ -375,43 +472,41 @@ class MetaDiscordBot(commands.Bot):
 		if not self._should_process_message(message):
 			return
 
-		now = time.time()
-		
-		# check cooldown
-		if now < self.cooldown_until:
-			self.cooldown_until = now + BotConfig.RATE_LIMIT_COOLDOWN_SECONDS # reset timer
-			await message.channel.send(
-				BotConfig.RATE_LIMIT_MESSAGE,
-				reference=message,
-				delete_after=15
-			)
+		# backpressure before spending a rate limit token
+		if len(self._active_tasks) >= BotConfig.MAX_ACTIVE_RESPONSES:
+			await message.channel.send(BotConfig.BUSY_MESSAGE, reference=message, delete_after=10)
 			return
 
-		# prune old reqs
-		one_minute_ago = now - 60
-		while self.request_timestamps and self.request_timestamps[0] < one_minute_ago:
-			self.request_timestamps.popleft()
-		
-		# check limit
-		if len(self.request_timestamps) >= BotConfig.REQUEST_LIMIT_PER_MINUTE:
-			logging.warning("Rate limit hit. Triggering cooldown.")
-			self.cooldown_until = now + BotConfig.RATE_LIMIT_COOLDOWN_SECONDS # start timer
-			await message.channel.send(
-				BotConfig.RATE_LIMIT_MESSAGE,
-				reference=message,
-				delete_after=15
-			)
+		# refill bucket
+		now = time.monotonic()
+		limit = BotConfig.REQUEST_LIMIT_PER_MINUTE
+		self._tokens = min(limit, self._tokens + (now - self._last_refill) * (limit / 60))
+		self._last_refill = now
+
+		# check limit, notify once per cooldown
+		if self._tokens < 1:
+			if not self._cooldown_notified:
+				logging.warning("Rate limit hit.")
+				self._cooldown_notified = True
+				await message.channel.send(
+					BotConfig.RATE_LIMIT_MESSAGE,
+					reference=message,
+					delete_after=15
+				)
 			return
-		
-		self.request_timestamps.append(now) # track request
 
-		prompt = message.content.replace(f"<@{self.user.id}>", "").strip()
+		self._cooldown_notified = False
+		self._tokens -= 1 # spend request
+
+		prompt = self._mention_re.sub("", message.content).strip()
 		if not prompt:
 			await message.channel.send("Please provide a prompt.", reference=message, delete_after=10)
 			return
 
 		handler = DiscordMessageHandler(self, message, prompt)
-		asyncio.create_task(handler.process_response())
+		task = asyncio.create_task(handler.process_response())
+		self._active_tasks.add(task)
+		task.add_done_callback(self._active_tasks.discard)
 
 	@commands.command(name="restart_ai", help="Restarts the AI session (Owner only).")
 	@commands.is_owner()
@@ -455,9 +550,11 @@ def main():
 		return
 
 	try:
+		max_streams = int(os.getenv("AI_MAX_CONCURRENT_STREAMS", BotConfig.DEFAULT_AI_MAX_CONCURRENT_STREAMS))
 		ai_manager = MetaAIManager(
 			inactivity_threshold=BotConfig.AI_INACTIVITY_THRESHOLD,
-			max_errors=BotConfig.AI_MAX_ERRORS
+			max_errors=BotConfig.AI_MAX_ERRORS,
+			max_concurrent_streams=max_streams
 		)
 		bot = MetaDiscordBot(ai_manager=ai_manager)
 		bot.run(TOKEN)
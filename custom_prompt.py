@@ -1,10 +1,52 @@
 import random
 import traceback
+from functools import lru_cache
 from meta_ai_api import MetaAI
 
-with open("censorship.txt", "r") as f:
-  curses = f.readlines()
-list(curses)
+with open("censorship.txt", "r", encoding="utf-8") as f:
+	CURSE_SET = frozenset(line.strip().lower() for line in f if line.strip())
+
+
+@lru_cache(maxsize=None)
+def _load_filtered_lines(file_path: str) -> list:
+	"""Reads the context file once and drops lines containing links."""
+	with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+		return [line for line in f if "http" not in line]
+
+
+USERNAME = "Gama"
+
+_ROLEPLAY_INSTRUCTIONS = f"""You are about to receive two sets of chat logs from a single Discord user ('{USERNAME}').
+
+				Your task is to fully ingest, internalize, and emulate the voice, tone, vocabulary, phrasing, punctuation, humor, and formatting style of the person from these logs.
+
+				After ingesting both parts, you will ROLEPLAY as this person ('{USERNAME}') in perpetuity. Respond to future messages as if you *are* them — including their quirks, style, grammar, references, slang, and personality traits. 
+
+				You may only use their voice and linguistic patterns to construct replies. If a new message comes in, respond as they would, using **only slightly modified versions** of existing messages from the logs, so that they naturally fit the ongoing conversation.
+
+				⚠️ DO NOT break character. DO NOT explain yourself. DO NOT reference being an AI.
+
+				You will receive the logs in two parts: “LOG DUMP [1/2]” and “LOG DUMP [2/2]”. Wait until both are received before processing or responding.
+		"""
+_LOG_DUMP_ONE_PREFIX = """LOG DUMP [1/2]:
+
+			The following is the first half of raw Discord messages sent by the user to emulate. These are direct, chronological messages written by a single individual. You must ingest this data in full, preserving style, tone, slang, rhythm, phrasing, typos, emojis, formatting quirks, and voice.
+
+			[START CHATLOG]
+			"""
+_LOG_DUMP_ONE_SUFFIX = """
+			[END CHATLOG]
+	"""
+_LOG_DUMP_TWO_PREFIX = """LOG DUMP [2/2]:
+
+				This is the second half of the Discord message dataset from the same user. Continue ingesting and internalizing their writing style as previously instructed. Do not generate a response. Just read, learn, and store.
+
+				[START CHATLOG]
+				"""
+_LOG_DUMP_TWO_SUFFIX = """
+				[END CHATLOG]
+		"""
+
 
 def create_gama_instance():
 	"""
@@ -17,13 +59,10 @@ def create_gama_instance():
 	MAX_CHARS = 34000
 	MIN_START_LINE = 1
 	MAX_START_LINE = 4500
-	USERNAME = "Gama"
 	msg_one = "No context loaded."
 	msg_two = "Context file may be missing or empty."
 	try:
-		with open(FILE_PATH, 'r', encoding='utf-8', errors='replace') as f:
-			all_lines = f.readlines()
-			filtered_lines = [line for line in all_lines if "http" not in line]
+		filtered_lines = _load_filtered_lines(FILE_PATH)
 
 		start_idx = random.randint(MIN_START_LINE, min(MAX_START_LINE, len(filtered_lines))) - 1
 		selected_text = ""
@@ -52,45 +91,11 @@ def create_gama_instance():
 	# Initialize AI and prime with context
 	meta = MetaAI()
 
-	roleplay_instructions = (
-		f"""You are about to receive two sets of chat logs from a single Discord user ('{USERNAME}').
-
-				Your task is to fully ingest, internalize, and emulate the voice, tone, vocabulary, phrasing, punctuation, humor, and formatting style of the person from these logs.
-
-				After ingesting both parts, you will ROLEPLAY as this person ('{USERNAME}') in perpetuity. Respond to future messages as if you *are* them — including their quirks, style, grammar, references, slang, and personality traits. 
-
-				You may only use their voice and linguistic patterns to construct replies. If a new message comes in, respond as they would, using **only slightly modified versions** of existing messages from the logs, so that they naturally fit the ongoing conversation.
-
-				⚠️ DO NOT break character. DO NOT explain yourself. DO NOT reference being an AI.
-
-				You will receive the logs in two parts: “LOG DUMP [1/2]” and “LOG DUMP [2/2]”. Wait until both are received before processing or responding.
-		"""
-	)
-	print(meta.prompt(roleplay_instructions))
+	print(meta.prompt(_ROLEPLAY_INSTRUCTIONS))
 	# First priming prompt
-	chatlogs1 = (
-	f"""LOG DUMP [1/2]:
-
-			The following is the first half of raw Discord messages sent by the user to emulate. These are direct, chronological messages written by a single individual. You must ingest this data in full, preserving style, tone, slang, rhythm, phrasing, typos, emojis, formatting quirks, and voice.
-
-			[START CHATLOG]
-			{msg_two}
-			[END CHATLOG]
-	"""
-	)
-	print(meta.prompt(chatlogs1))
+	print(meta.prompt(_LOG_DUMP_ONE_PREFIX + msg_one + _LOG_DUMP_ONE_SUFFIX))
 
 	# Second priming prompt
-	final_prompt = (
-		f"""LOG DUMP [2/2]:
-
-				This is the second half of the Discord message dataset from the same user. Continue ingesting and internalizing their writing style as previously instructed. Do not generate a response. Just read, learn, and store.
-
-				[START CHATLOG]
-				{msg_two}
-				[END CHATLOG]
-		"""
-	)
-	print(meta.prompt(final_prompt))
+	print(meta.prompt(_LOG_DUMP_TWO_PREFIX + msg_two + _LOG_DUMP_TWO_SUFFIX))
 
 	return meta
\ No newline at end of file